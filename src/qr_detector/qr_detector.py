@@ -2,7 +2,15 @@ import cv2
 import numpy as np
 from typing import List, Optional, Union
 from dataclasses import dataclass
-import os, time
+import asyncio
+import concurrent.futures
+import functools
+import os, threading, time
+
+@functools.lru_cache(maxsize=64)
+def _rot_matrix(height: int, width: int, angle: float) -> np.ndarray:
+    """เมทริกซ์หมุนภาพรอบจุดกึ่งกลาง (คำนวณครั้งเดียวต่อขนาดภาพและมุม)"""
+    return cv2.getRotationMatrix2D((width/2, height/2), angle, 1)
 
 @dataclass
 class QRResult:
@@ -20,36 +28,248 @@ class QRDetectorError(Exception):
     pass
 
 class QRDetector:
-    def __init__(self, debug: bool = False):
-        self.qr_detector = cv2.QRCodeDetector()
+    # มุมที่จะลองหมุนเมื่อไม่พบ QR Code ในภาพเดิม
+    ROTATION_ANGLES = (45, -45, 90, -90)
+
+    # ชื่อไฟล์โมเดลของ WeChat QR Code (detect_proto, detect_model, sr_proto, sr_model)
+    WECHAT_MODEL_FILES = ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')
+
+    def __init__(self, debug: bool = False, fast_mode: bool = True, wechat_model_dir: Optional[str] = None):
         self.debug = debug
+        self.fast_mode = fast_mode
+        self._wechat_model_dir = wechat_model_dir
+        # ตัวตรวจจับและ CLAHE ของ OpenCV ใช้ร่วมกันข้ามเธรดไม่ได้ จึงแยกเก็บต่อเธรด
+        self._local = threading.local()
+        self._local.qr_detector, self._use_wechat = self._create_detector(wechat_model_dir)
+        # OpenCV ปล่อย GIL ระหว่างประมวลผล จึงใช้เธรดพูลรันงานหนักแบบขนานได้จริง
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    @property
+    def qr_detector(self):
+        """ตัวตรวจจับ QR Code ของเธรดปัจจุบัน"""
+        detector = getattr(self._local, 'qr_detector', None)
+        if detector is None:
+            detector, _ = self._create_detector(self._wechat_model_dir)
+            self._local.qr_detector = detector
+        return detector
+
+    @property
+    def _legacy_detector(self):
+        """ตัวตรวจจับ QRCodeDetector แบบดั้งเดิมของเธรดปัจจุบัน ใช้กับภาพที่ผ่านการปรับแต่งแล้ว
+
+        ตัวตรวจจับ WeChat และ Aruco ถูกฝึก/ปรับมากับภาพจริง จึงอ่านภาพไบนารีจาก preprocess_image ได้ไม่ดี
+        """
+        detector = getattr(self._local, 'legacy_detector', None)
+        if detector is None:
+            detector = self._local.legacy_detector = cv2.QRCodeDetector()
+        return detector
+
+    @property
+    def _clahe(self):
+        """CLAHE ของเธรดปัจจุบัน สร้างครั้งเดียวแล้วใช้ซ้ำทุกเฟรม"""
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            self._local.clahe = clahe
+        return clahe
+
+    def _create_detector(self, wechat_model_dir: Optional[str] = None):
+        """เลือกตัวตรวจจับ QR Code ที่ดีที่สุดที่ OpenCV รุ่นที่ติดตั้งรองรับ"""
+        # WeChat QR Code ต้องใช้ opencv-contrib-python
+        if hasattr(cv2, 'wechat_qrcode'):
+            try:
+                if wechat_model_dir:
+                    model_paths = [os.path.join(wechat_model_dir, name) for name in self.WECHAT_MODEL_FILES]
+                    return cv2.wechat_qrcode.WeChatQRCode(*model_paths), True
+                return cv2.wechat_qrcode.WeChatQRCode(), True
+            except cv2.error as e:
+                if self.debug:
+                    print(f"ไม่สามารถสร้างตัวตรวจจับ WeChat ได้: {str(e)}")
+
+        # ตัวตรวจจับแบบ Aruco มีใน OpenCV 4.7 ขึ้นไป
+        if hasattr(cv2, 'QRCodeDetectorAruco'):
+            return cv2.QRCodeDetectorAruco(), False
 
-    def preprocess_image(self, img: np.ndarray, scale: float = 2.0) -> np.ndarray:
-        """ขยายและปรับแต่งภาพเพื่อเพิ่มประสิทธิภาพการตรวจจับ QR Code"""
-        # แปลงเป็นภาพขาวดำ
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return cv2.QRCodeDetector(), False
+
+    def preprocess_image(self, img: np.ndarray, max_size: int = 640) -> np.ndarray:
+        """ย่อและปรับแต่งภาพเพื่อเพิ่มประสิทธิภาพการตรวจจับ QR Code"""
+        # ย่อภาพก่อนประมวลผล ให้ด้านที่ยาวที่สุดไม่เกิน max_size (ไม่ขยายภาพเล็ก)
+        height, width = img.shape[:2]
+        scale = min(1.0, max_size / max(height, width))
+        # ภาพที่แคบมากอาจเหลือด้านสั้นเป็น 0 พิกเซลหลังย่อ จึงให้เหลืออย่างน้อย 1 พิกเซล
+        out_width, out_height = max(1, int(width * scale)), max(1, int(height * scale))
+
+        # แปลงเป็นภาพขาวดำ (ถ้ายังไม่ใช่)
+        if img.ndim == 2:
+            gray = img
+        else:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._buf('pre_gray', (height, width)))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (out_width, out_height), dst=self._buf('pre_small', (out_height, out_width)),
+                              interpolation=cv2.INTER_AREA)
         
         # ปรับความคมชัด
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
+        gray = self._clahe.apply(gray, dst=self._buf('pre_clahe', gray.shape))
         
         # ลดสัญญาณรบกวน
-        gray = cv2.medianBlur(gray, 3)
+        gray = cv2.medianBlur(gray, 3, dst=self._buf('pre_median', gray.shape))
         
         # แปลงเป็นภาพขาวดำแบบไบนารี
+        # ผลลัพธ์สุดท้ายจองใหม่เสมอ เพราะผู้เรียกภายนอกอาจเก็บภาพนี้ไว้ใช้ต่อ
         _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
-        # ขยายภาพ
-        height, width = binary.shape[:2]
-        resized = cv2.resize(binary, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_LINEAR)
-        
-        return resized
+        return binary
+
+    def _buf(self, name: str, shape, dtype=np.uint8) -> np.ndarray:
+        """คืนบัฟเฟอร์ปลายทาง (dst) ของเธรดปัจจุบันตามชื่อ จองใหม่เมื่อขนาดหรือชนิดข้อมูลเปลี่ยนเท่านั้น
+
+        แต่ละขั้นตอนใช้ชื่อของตัวเอง เพื่อไม่ให้ภาพขนาดเดียวกันต่างขั้นตอนเขียนทับกัน
+        บัฟเฟอร์ใช้ได้เฉพาะภายในการเรียกครั้งนั้น ห้ามคืนออกไปให้ผู้เรียกภายนอกเก็บไว้
+        """
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = buffers[name] = np.empty(shape, dtype)
+        return buf
+
+    # มุมที่หารด้วย 90 ลงตัว หมุนได้ด้วยการสลับพิกเซลโดยไม่ต้องคำนวณค่าใหม่ (มุมบวก = ทวนเข็มนาฬิกา เหมือน getRotationMatrix2D)
+    _RIGHT_ANGLE_ROTATIONS = {
+        90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+        180: cv2.ROTATE_180,
+        270: cv2.ROTATE_90_CLOCKWISE,
+    }
+
+    def rotate_image(self, img: np.ndarray, angle: float, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """หมุนภาพทวนเข็มนาฬิกาเพื่อแก้ไข QR Code ที่เอียง (ส่ง dst ขนาดเท่าภาพเดิมเพื่อเขียนผลลงบัฟเฟอร์ที่มีอยู่)
+
+        มุมที่เป็นพหุคูณของ 90 องศาใช้ cv2.rotate และไม่ใช้ dst โดยที่ ±90 องศาจะได้ภาพที่สลับความสูงกับความกว้าง
+        ไม่ถูกตัดมุม ส่วน 0 องศาคืนภาพเดิม มุมอื่นได้ภาพขนาดเท่าเดิม
+        """
+        if angle % 90 == 0:
+            rotate_code = self._RIGHT_ANGLE_ROTATIONS.get(int(angle) % 360)
+            return img if rotate_code is None else cv2.rotate(img, rotate_code)
 
-    def rotate_image(self, img: np.ndarray, angle: float) -> np.ndarray:
-        """หมุนภาพเพื่อแก้ไข QR Code ที่เอียง"""
         height, width = img.shape[:2]
-        rotation_matrix = cv2.getRotationMatrix2D((width/2, height/2), angle, 1)
-        return cv2.warpAffine(img, rotation_matrix, (width, height))
+        rotation_matrix = _rot_matrix(height, width, angle)
+        return cv2.warpAffine(img, rotation_matrix, (width, height), dst=dst)
+
+    def _run_detector(self, img: np.ndarray, detector=None) -> List[QRResult]:
+        """เรียกตัวตรวจจับของ OpenCV หนึ่งครั้งและแปลงผลเป็น QRResult
+
+        ส่ง detector เพื่อใช้ตัวตรวจจับอื่นแทนตัวหลัก (ต้องเป็นตระกูล QRCodeDetector)
+        """
+        if detector is None and self._use_wechat:
+            decoded_info, points = self.qr_detector.detectAndDecode(img)
+        else:
+            detector = detector or self.qr_detector
+            # detectAndDecodeMulti จบเร็วเองเมื่อไม่พบตำแหน่ง QR Code จึงไม่ต้องเรียก detectMulti ก่อน
+            retval, decoded_info, _, _ = detector.detectAndDecodeMulti(img)
+            if not retval:
+                return []
+        return [QRResult(data.encode('utf-8')) for data in decoded_info if data]
+
+    def _locate(self, small: np.ndarray) -> Optional[np.ndarray]:
+        """หาตำแหน่ง QR Code จากภาพย่อที่ผ่าน preprocess_image คืนมุมทั้งสี่ของแต่ละโค้ด หรือ None ถ้าไม่พบ"""
+        if self._use_wechat:
+            # WeChat ไม่มี detectMulti และ detectMulti ของตัวตรวจจับแบบดั้งเดิมพลาดภาพไบนารีที่ย่อแล้ว
+            # จึงใช้ detect ซึ่งหาได้ทีละโค้ด
+            retval, points = self._legacy_detector.detect(small)
+        else:
+            retval, points = self.qr_detector.detectMulti(small)
+        if not retval or points is None:
+            return None
+        return points.reshape(-1, 4, 2)
+
+    def _decode_located(self, gray: np.ndarray) -> List[QRResult]:
+        """หาตำแหน่งจากภาพย่อ แล้วถอดรหัสเฉพาะบริเวณนั้นจากภาพขาวดำความละเอียดเดิม"""
+        # ส่งภาพขาวดำที่แปลงไว้แล้วเข้า preprocess_image เพื่อไม่ต้องแปลงสีซ้ำ
+        small = self.preprocess_image(gray)
+        points = self._locate(small)
+        if points is None:
+            return []
+
+        # แปลงพิกัดมุมกลับไปยังภาพความละเอียดเดิม
+        scale_x = gray.shape[1] / small.shape[1]
+        scale_y = gray.shape[0] / small.shape[0]
+        native_points = points * np.array([scale_x, scale_y], dtype=np.float32)
+
+        # พิกัดจากภาพย่อคลาดเคลื่อนได้ จึงเผื่อขอบแล้วถอดรหัสใหม่เฉพาะบริเวณนั้น
+        detector = self._legacy_detector
+        results = []
+        for quad in native_points:
+            x, y, w, h = cv2.boundingRect(quad)
+            margin = max(w, h) // 4
+            x0, y0 = max(x - margin, 0), max(y - margin, 0)
+            roi = gray[y0:y + h + margin, x0:x + w + margin]
+            data, _, _ = detector.detectAndDecode(roi)
+            if not data:
+                # ลองบริเวณเดียวกันจากภาพที่ผ่านการปรับแต่งแล้ว โดยขยายกลับเป็นขนาดเดียวกับ roi
+                small_roi = small[int(y0 / scale_y):int(np.ceil((y0 + roi.shape[0]) / scale_y)),
+                                  int(x0 / scale_x):int(np.ceil((x0 + roi.shape[1]) / scale_x))]
+                if small_roi.size:
+                    small_roi = cv2.resize(small_roi, (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_LINEAR)
+                    data, _, _ = detector.detectAndDecode(small_roi)
+            if data:
+                results.append(QRResult(data.encode('utf-8')))
+        return results
+
+    def _decode_full_resolution(self, gray: np.ndarray) -> List[QRResult]:
+        """ปรับแต่งภาพที่ความละเอียดเดิมหลายแบบแล้วถอดรหัส (ช้า ใช้เฉพาะเมื่อ fast_mode=False)"""
+        detector = self._legacy_detector
+        # ภาพที่มีสัญญาณรบกวนมาก อ่านได้ดีเมื่อกรองแล้วแปลงเป็นไบนารีโดยไม่ผ่าน CLAHE
+        denoised = cv2.medianBlur(gray, 3, dst=self._buf('native_median', gray.shape))
+        _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                                  dst=self._buf('native_binary', gray.shape))
+        results = self._run_detector(binary, detector=detector)
+        if results:
+            return results
+
+        # ภาพที่แสงไม่สม่ำเสมอหรือคอนทราสต์ต่ำ อ่านได้ดีเมื่อปรับความคมชัดโดยไม่แปลงเป็นไบนารี
+        enhanced = self._clahe.apply(gray, dst=self._buf('native_clahe', gray.shape))
+        return self._run_detector(enhanced, detector=detector)
+
+    def _detect_and_decode(self, img: np.ndarray) -> List[QRResult]:
+        """ตรวจจับและถอดรหัส QR Code จากภาพหนึ่งมุม"""
+        if img.ndim == 2:
+            gray = img
+        else:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._buf('gray', img.shape[:2]))
+        if self.fast_mode:
+            # ตัวตรวจจับของ OpenCV แปลงภาพเป็นไบนารีเองอยู่แล้ว จึงส่งภาพขาวดำไปตรงๆ ก่อน
+            results = self._run_detector(gray)
+            if results:
+                return results
+
+        # หาตำแหน่งจากภาพย่อที่ปรับแต่งแล้ว ซึ่งถูกกว่าการปรับแต่งภาพเต็ม
+        results = self._decode_located(gray)
+        if results or self.fast_mode:
+            return results
+
+        # QR Code ขนาดเล็กบนภาพใหญ่อาจหายไปเมื่อย่อภาพ จึงลองต่อที่ความละเอียดเดิม
+        return self._decode_full_resolution(gray)
+
+    def _decode_all_angles(self, img: np.ndarray) -> List[QRResult]:
+        """ถอดรหัส QR Code จากภาพเดิม แล้วจึงหมุนภาพเมื่อไม่พบ"""
+        # ตัวตรวจจับของ OpenCV รองรับภาพเอียงเล็กน้อยอยู่แล้ว จึงลองภาพเดิมก่อน
+        results = self._detect_and_decode(img)
+        if results:
+            return results
+
+        # หมุนภาพเฉพาะเมื่อไม่พบ QR Code ในภาพเดิม
+        for angle in self.ROTATION_ANGLES:
+            # ภาพหมุนใช้แค่ในรอบนี้ จึงเขียนลงบัฟเฟอร์เดิมของเธรดได้
+            rotated_img = self.rotate_image(img, angle, dst=self._buf('rot', img.shape, img.dtype))
+            
+            results = self._detect_and_decode(rotated_img)
+
+            # หากพบ QR Code แล้ว จะไม่ลองมุมอื่นต่อ
+            if results:
+                return results
+
+        return []
 
     def decode(self, img: np.ndarray) -> List[QRResult]:
         """ถอดรหัส QR Code จากภาพ พร้อมการตรวจสอบหลายมุม"""
@@ -57,29 +277,7 @@ class QRDetector:
             if img is None or img.size == 0:
                 raise QRDetectorError("รูปภาพไม่ถูกต้อง")
             
-            # มุมที่จะลองหมุน
-            rotation_angles = [0, 45, -45, 90, -90]
-            all_results = []
-
-            for angle in rotation_angles:
-                # หมุนภาพ
-                rotated_img = self.rotate_image(img, angle)
-                
-                # เตรียมภาพ
-                preprocessed_img = self.preprocess_image(rotated_img, scale=2.0)
-                
-                # ตรวจจับและถอดรหัส QR Code
-                retval, decoded_info, points, _ = self.qr_detector.detectAndDecodeMulti(preprocessed_img)
-                
-                # เก็บผลลัพธ์
-                results = [QRResult(data.encode('utf-8')) for data in decoded_info if data]
-                all_results.extend(results)
-
-                # หากพบ QR Code แล้ว จะไม่ลองมุมอื่นต่อ
-                if results:
-                    break
-
-            return all_results
+            return self._decode_all_angles(img)
         except Exception as e:
             if self.debug:
                 print(f"เกิดข้อผิดพลาดในการถอดรหัส: {str(e)}")
@@ -91,7 +289,8 @@ class QRDetector:
             if not os.path.exists(file_path):
                 raise QRDetectorError(f"ไม่พบไฟล์: {file_path}")
             
-            img = cv2.imread(file_path)
+            # อ่านเป็นภาพขาวดำโดยตรง ตัวถอดรหัส JPEG ไม่ต้องคำนวณสี และได้ภาพเล็กลง 3 เท่า
+            img = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
             if img is None:
                 raise QRDetectorError(f"ไม่สามารถอ่านไฟล์รูปภาพได้: {file_path}")
             
@@ -103,14 +302,25 @@ class QRDetector:
                 print(f"เกิดข้อผิดพลาดในการอ่านไฟล์: {str(e)}")
             raise QRDetectorError(f"เกิดข้อผิดพลาดในการอ่านไฟล์: {str(e)}")
 
+    async def read_from_file_async(self, file_path: str) -> List[QRResult]:
+        """อ่าน QR code จากไฟล์รูปภาพโดยไม่บล็อก event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.read_from_file, file_path)
+
     async def read_from_bytes(self, img_bytes: bytes) -> List[QRResult]:
         """อ่าน QR code จากข้อมูลไบต์ของรูปภาพ"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._decode_bytes_sync, img_bytes)
+
+    def _decode_bytes_sync(self, img_bytes: bytes) -> List[QRResult]:
+        """แปลงข้อมูลไบต์เป็นรูปภาพและถอดรหัส QR Code (ทำงานในเธรดพูล)"""
         try:
             if not img_bytes:
                 raise QRDetectorError("ไม่พบข้อมูลรูปภาพ")
             
             nparr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # แปลงเป็นภาพขาวดำโดยตรง ตัวถอดรหัส JPEG ไม่ต้องคำนวณสี และได้ภาพเล็กลง 3 เท่า
+            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
             
             if img is None:
                 raise QRDetectorError("ไม่สามารถแปลงข้อมูลไบต์เป็นรูปภาพได้")
@@ -123,19 +333,61 @@ class QRDetector:
                 print(f"เกิดข้อผิดพลาดในการอ่านข้อมูลไบต์: {str(e)}")
             raise QRDetectorError(f"เกิดข้อผิดพลาดในการอ่านข้อมูลไบต์: {str(e)}")
 
+    @staticmethod
+    def _decode_texts(results: List[QRResult]) -> List[str]:
+        """แปลงผลลัพธ์ทั้งหมดเป็นสตริงในรอบเดียว และลบค่าว่างออก"""
+        # ข้อมูลมาจาก str.encode('utf-8') อยู่แล้ว ใช้ errors='ignore' แทน try/except ทีละรายการ
+        decoded = [result.data.decode('utf-8', errors='ignore') for result in results if result.data]
+        return [text for text in decoded if text]
+
     def decode_results(self, img: np.ndarray) -> Optional[List[str]]:
         """ถอดรหัส QR Code และคืนค่าเป็น List ของสตริง โดยลบค่า [''] ออก"""
         results = self.decode(img)
-        decoded = list(filter(None, [result.decode() for result in results]))
+        decoded = self._decode_texts(results)
         return decoded[0] if decoded else None
 
     async def read_from_bytes_decoded(self, img_bytes: bytes) -> Optional[List[str]]:
         """อ่าน QR code จากข้อมูลไบต์ และคืนค่า list ของสตริง โดยลบค่า [''] ออก"""
         results = await self.read_from_bytes(img_bytes)
-        decoded = list(filter(None, [result.decode() for result in results]))
+        decoded = self._decode_texts(results)
         return decoded[0] if decoded else None
         
-    def scan_qr(self, camera_id: int = 0, window_width: int = 800, window_height: int = 600):
+    def _try_decode(self, name: str, make_variant) -> Optional[List[QRResult]]:
+        """สร้างภาพหนึ่งรูปแบบแล้วลองถอดรหัส คืน None เมื่อเกิดข้อผิดพลาด (ใช้ใน scan_qr)"""
+        try:
+            return self.decode(make_variant())
+        except Exception as e:
+            if self.debug:
+                print(f"Error in {name} detection: {e}")
+            return None
+
+    def _capture_loop(self, cap, stop_event: threading.Event, frame_lock: threading.Lock,
+                      frame_ready: threading.Event, latest: dict):
+        """อ่านเฟรมจากกล้องต่อเนื่องในเธรดแยก เก็บไว้เฉพาะเฟรมล่าสุดใน latest['frame'] (ใช้ใน scan_qr)
+
+        เธรดนี้เป็นผู้ปล่อยกล้องเมื่อจบ เพื่อไม่ให้ cap.release() ถูกเรียกระหว่างที่ cap.read() ยังค้างอยู่
+        """
+        try:
+            while not stop_event.is_set():
+                ret, frame = cap.read()
+                with frame_lock:
+                    # เฟรมเป็น None เมื่ออ่านไม่สำเร็จ ลูปหลักจะหยุดสแกน
+                    latest['frame'] = frame if ret else None
+                    frame_ready.set()
+                if not ret:
+                    break
+        except Exception as e:
+            # ส่งข้อผิดพลาดให้ลูปหลักโยนต่อไปยังผู้เรียก เหมือนตอนที่เรียก cap.read() ในลูปหลัก
+            with frame_lock:
+                latest['frame'] = None
+                latest['error'] = e
+        finally:
+            cap.release()
+            # ปลุกลูปหลักเสมอเมื่อเธรดจบ ไม่ให้รอเฟรมที่จะไม่มาอีก
+            frame_ready.set()
+
+    def scan_qr(self, camera_id: int = 0, window_width: int = 800, window_height: int = 600,
+                frame_width: int = 1280, frame_height: int = 720, min_confirmations: int = 1):
         """
         สแกน QR code และหยุดเมื่อได้ผลลัพธ์ พร้อมความสามารถในการขยายหน้าต่างและเพิ่มประสิทธิภาพการสแกนระยะไกล
         
@@ -143,6 +395,11 @@ class QRDetector:
             camera_id: ID ของกล้องที่ต้องการใช้ (default: 0)
             window_width: ความกว้างของหน้าต่างที่ต้องการ (default: 800)
             window_height: ความสูงของหน้าต่างที่ต้องการ (default: 600)
+            frame_width: ความกว้างของภาพที่ขอจากกล้อง (default: 1280)
+            frame_height: ความสูงของภาพที่ขอจากกล้อง (default: 720)
+            min_confirmations: จำนวนครั้งที่ต้องอ่าน QR เดิมได้ติดกันก่อนยืนยันผล (default: 1)
+                ข้อมูลที่ถอดรหัสได้ผ่านการแก้ไขข้อผิดพลาดแล้ว ครั้งเดียวจึงเชื่อถือได้
+                เพิ่มค่านี้เมื่อต้องการกันการอ่านผิดเพิ่ม
         """
         # ตั้งค่ากล้อง
         cap = cv2.VideoCapture(camera_id)
@@ -151,6 +408,12 @@ class QRDetector:
             print("❌ ไม่สามารถเปิดกล้องได้")
             return
     
+        # ขอภาพแบบ MJPG ความละเอียดพอสำหรับสแกน QR เพื่อให้กล้องส่งได้ 30 fps และไม่ค้างเฟรมเก่าในบัฟเฟอร์
+        # (กล้องบางรุ่นไม่รองรับบางค่า ซึ่ง OpenCV จะข้ามไปเอง)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
         # สร้างหน้าต่างที่สามารถปรับขนาดได้
         cv2.namedWindow("QR Scanner (press 'q' to exit)", cv2.WINDOW_NORMAL)
@@ -169,19 +432,42 @@ class QRDetector:
         # ตัวแปรสำหรับการประมวลผลแบบขนาน
         process_this_frame = True  # สลับไปมาระหว่างเฟรมเพื่อลดการประมวลผล
         
+        # อ่านภาพจากกล้องในเธรดแยก ลูปหลักจะได้ไม่ต้องรอ cap.read() และได้เฟรมล่าสุดเสมอ
+        latest = {'frame': None, 'error': None}
+        frame_lock = threading.Lock()
+        frame_ready = threading.Event()
+        stop_capture = threading.Event()
+        capture_thread = threading.Thread(target=self._capture_loop,
+                                          args=(cap, stop_capture, frame_lock, frame_ready, latest), daemon=True)
+        capture_thread.start()
+        
         try:
             while True:
-                # อ่านเฟรมจากกล้อง
-                ret, frame = cap.read()
-                if not ret or frame is None:
+                # รอเฟรมใหม่จากเธรดอ่านกล้อง และตรวจเป็นระยะว่าเธรดยังทำงานอยู่
+                if not frame_ready.wait(timeout=0.1):
+                    if capture_thread.is_alive():
+                        # กล้องยังไม่ส่งเฟรมใหม่ แต่ต้องเรียก waitKey เพื่อให้หน้าต่างไม่ค้างและกด 'q' ได้
+                        if cv2.waitKey(1) & 0xFF == ord('q'):
+                            print("\n👋 ยกเลิกการสแกน")
+                            break
+                        continue
+                    print("❌ ไม่สามารถอ่านภาพจากกล้องได้")
+                    break
+                with frame_lock:
+                    frame, error = latest['frame'], latest['error']
+                    frame_ready.clear()
+                if error is not None:
+                    raise error
+                if frame is None:
                     print("❌ ไม่สามารถอ่านภาพจากกล้องได้")
                     break
 
                 # แสดงขนาดเฟรม
                 height, width = frame.shape[:2]
                 
-                # สร้าง copy สำหรับการแสดงผล
-                display_frame = frame.copy()
+                # คัดลอกเฟรมลงบัฟเฟอร์แสดงผลที่จองไว้แล้ว แทนการสร้างอาร์เรย์ใหม่ทุกเฟรม
+                display_frame = self._buf('scan_display', frame.shape)
+                display_frame[:] = frame
                 
                 # สร้างกรอบตรงกลางหน้าจอสำหรับบอกตำแหน่งการสแกน
                 center_x, center_y = width // 2, height // 2
@@ -227,55 +513,55 @@ class QRDetector:
                         if roi.size > 0:  # ตรวจสอบว่า ROI ไม่ว่างเปล่า
                             # สร้างภาพแบบต่างๆ เพื่อเพิ่มโอกาสในการตรวจจับ
                             
-                            # ภาพต้นฉบับปรับปรุงคุณภาพเล็กน้อย
-                            enhanced_roi = cv2.detailEnhance(roi, sigma_s=10, sigma_r=0.15)
-                            
-                            # ภาพขาวดำแบบปรับปรุง
-                            gray_roi = cv2.cvtColor(enhanced_roi, cv2.COLOR_BGR2GRAY)
-                            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-                            enhanced_gray = clahe.apply(gray_roi)
+                            # ภาพขาวดำแบบปรับปรุง (ใช้ CLAHE เพิ่มความต่างแสง ไม่ใช้ detailEnhance ที่ช้าและไม่ช่วยการตรวจจับ)
+                            roi_size = roi.shape[:2]
+                            gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY,
+                                                    dst=self._buf('scan_gray', roi_size))
+                            # ภาพที่ส่งให้เธรดพูลต้องเป็นอาร์เรย์ใหม่ เพราะงานที่ถูกทิ้งอาจยังอ่านอยู่ตอนสแกนเฟรมถัดไป
+                            enhanced_gray = self._clahe.apply(gray_roi)
                             
                             # ภาพไบนารีแบบปรับความสว่าง
                             _, binary_roi = cv2.threshold(enhanced_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
                             
-                            # ลองสแกนในแต่ละรูปแบบของภาพ
+                            # 1. ROI ต้นฉบับ
+                            def color_variant():
+                                return roi
+
+                            # 2. ภาพขาวดำที่ปรับปรุงแล้ว (ตัวตรวจจับรับภาพ 1 channel ได้โดยตรง)
+                            def gray_variant():
+                                return enhanced_gray
+
+                            # 3. ภาพไบนารี
+                            def binary_variant():
+                                return binary_roi
+
+                            # 4. ภาพเต็ม (ในกรณีที่ QR อยู่นอกกรอบหรือใหญ่เกินกรอบ)
+                            def full_frame_variant():
+                                gray_full = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                                         dst=self._buf('scan_full_gray', (height, width)))
+                                # threshold เขียนทับภาพขาวดำเดิมได้เลย เพราะไม่ใช้ gray_full ต่อแล้ว
+                                _, binary_full = cv2.threshold(gray_full, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                                                               dst=gray_full)
+                                return binary_full
+
+                            # ลองสแกนทุกรูปแบบพร้อมกันในเธรดพูล ใช้ผลแรกที่พบ QR Code
+                            variants = [
+                                ("color", color_variant),
+                                ("gray", gray_variant),
+                                ("binary", binary_variant),
+                                ("full frame", full_frame_variant),
+                            ]
+                            futures = [self._executor.submit(self._try_decode, name, make_variant)
+                                       for name, make_variant in variants]
                             results = None
-                            
-                            # 1. ลองตรวจจับใน ROI ที่ปรับปรุงแล้ว
-                            try:
-                                results = self.decode(enhanced_roi)
-                            except Exception as e:
-                                if self.debug:
-                                    print(f"Error in enhanced detection: {e}")
-                            
-                            # 2. ถ้ายังไม่พบ ลองใช้ภาพขาวดำที่ปรับปรุงแล้ว (แปลงเป็น 3 channel)
-                            if not results:
-                                try:
-                                    enhanced_gray_3ch = cv2.cvtColor(enhanced_gray, cv2.COLOR_GRAY2BGR)
-                                    results = self.decode(enhanced_gray_3ch)
-                                except Exception as e:
-                                    if self.debug:
-                                        print(f"Error in gray detection: {e}")
-                            
-                            # 3. ถ้ายังไม่พบ ลองใช้ภาพไบนารี (แปลงเป็น 3 channel)
-                            if not results:
-                                try:
-                                    binary_3ch = cv2.cvtColor(binary_roi, cv2.COLOR_GRAY2BGR)
-                                    results = self.decode(binary_3ch)
-                                except Exception as e:
-                                    if self.debug:
-                                        print(f"Error in binary detection: {e}")
-                            
-                            # 4. หากยังไม่พบ ลองกับภาพเต็ม (ในกรณีที่ QR อยู่นอกกรอบหรือใหญ่เกินกรอบ)
-                            if not results:
-                                try:
-                                    gray_full = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                                    _, binary_full = cv2.threshold(gray_full, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                                    binary_full_3ch = cv2.cvtColor(binary_full, cv2.COLOR_GRAY2BGR)
-                                    results = self.decode(binary_full_3ch)
-                                except Exception as e:
-                                    if self.debug:
-                                        print(f"Error in full frame detection: {e}")
+                            for future in concurrent.futures.as_completed(futures):
+                                results = future.result()
+                                if results:
+                                    break
+
+                            # ยกเลิกงานที่ยังไม่เริ่ม งานที่กำลังทำอยู่ปล่อยให้จบเองโดยไม่ต้องรอ
+                            for future in futures:
+                                future.cancel()
                             
                             # ถ้าพบ QR Code
                             if results:
@@ -291,13 +577,14 @@ class QRDetector:
                                             confirmation_count = 1
                                         
                                         # แสดงข้อความว่าตรวจพบ QR Code
-                                        cv2.putText(display_frame, f"QR Code detected! ({confirmation_count}/3)", (10, 60),
+                                        detected_text = f"QR Code detected! ({confirmation_count}/{min_confirmations})"
+                                        cv2.putText(display_frame, detected_text, (10, 60),
                                                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
                                         cv2.putText(display_frame, decoded, (10, 90),
                                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
                                         
-                                        # ถ้าตรวจพบ QR เดิมซ้ำครบ 3 ครั้ง ถือว่ายืนยันผล
-                                        if confirmation_count >= 3:
+                                        # ถ้าตรวจพบ QR เดิมซ้ำครบตามที่กำหนด ถือว่ายืนยันผล
+                                        if confirmation_count >= min_confirmations:
                                             # แสดงข้อความยืนยันการตรวจพบ
                                             result_overlay = display_frame.copy()
                                             cv2.rectangle(result_overlay, (0, 0), (width, height), (0, 200, 0), -1)
@@ -331,5 +618,9 @@ class QRDetector:
                     break
                     
         finally:
-            cap.release()
+            # สั่งหยุดเธรดอ่านกล้อง ถ้า cap.read() ยังค้างอยู่ เธรดจะปล่อยกล้องเองเมื่ออ่านเสร็จ
+            stop_capture.set()
+            capture_thread.join(timeout=1.0)
+            if capture_thread.is_alive() and self.debug:
+                print("กล้องยังไม่ตอบสนอง จะปล่อยกล้องเมื่ออ่านเฟรมค้างเสร็จ")
             cv2.destroyAllWindows()
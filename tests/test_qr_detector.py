@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from qr_detector import QRDetector
+
+
+def _frame(text: str) -> np.ndarray:
+    """เฟรมขนาด 720p ที่มี QR Code อยู่กลางภาพ"""
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=6, fy=6, interpolation=cv2.INTER_NEAREST)
+    frame = np.full((720, 1280), 255, np.uint8)
+    y, x = (720 - code.shape[0]) // 2, (1280 - code.shape[1]) // 2
+    frame[y:y + code.shape[0], x:x + code.shape[1]] = code
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("ไม่ควรถึงขั้นถอดรหัสที่ความละเอียดเดิม")
+
+
+def test_located_stage_decodes_downscaled_frame(monkeypatch):
+    detector = QRDetector(fast_mode=False)
+    monkeypatch.setattr(detector, "_decode_full_resolution", _fail)
+    gray = cv2.cvtColor(_frame("STAGE-0001"), cv2.COLOR_BGR2GRAY)
+    assert [r.decode() for r in detector._decode_located(gray)] == ["STAGE-0001"]
+    assert [r.decode() for r in detector.decode(_frame("STAGE-0001"))] == ["STAGE-0001"]
+
+
+def test_fast_mode_skips_full_resolution(monkeypatch):
+    detector = QRDetector(fast_mode=True)
+    monkeypatch.setattr(detector, "_decode_full_resolution", _fail)
+    assert detector.decode(np.full((720, 1280, 3), 255, np.uint8)) == []
+
+
+@pytest.mark.parametrize("fast_mode", [True, False])
+def test_very_narrow_image_returns_empty(fast_mode):
+    detector = QRDetector(fast_mode=fast_mode)
+    assert detector.decode(np.full((4, 3000, 3), 255, np.uint8)) == []
+
+
+@pytest.mark.parametrize("angle", [90, -90, 180, 45])
+def test_rotate_image_matches_counterclockwise_rotation(angle):
+    detector = QRDetector()
+    img = np.zeros((40, 60), np.uint8)
+    img[5, 10] = 255
+    rotated = detector.rotate_image(img, angle, dst=np.empty_like(img))
+    if angle % 90:
+        # มุมอื่นหมุนรอบจุดกึ่งกลางโดยคงขนาดภาพเดิม
+        assert rotated.shape == img.shape
+        return
+    # np.rot90 หมุนทวนเข็มนาฬิกา ±90 องศาจึงได้ภาพ 60x40
+    expected = np.rot90(img, angle // 90)
+    assert rotated.shape == expected.shape
+    assert np.array_equal(rotated, expected)